@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import copy
 import time
-import json
 import os
 import warnings
 
@@ -39,7 +38,7 @@ class DataService(object):
         if self.dataset == "spider":
             db_lists = []
             db_meta_dict = {}
-            for db_meta in json.load(open(os.path.join(GV.SPIDER_FOLDER, "tables.json"), "r")):
+            for db_meta in helpers.load_json(os.path.join(GV.SPIDER_FOLDER, "tables.json")):
                 db_lists.append(db_meta["db_id"])
                 db_meta_dict[db_meta["db_id"]] = db_meta
             self.db_lists = db_lists
@@ -48,6 +47,14 @@ class DataService(object):
             self.cur_q = None
             self.h_q = {}
             self.table_cols = []
+            self.text2sql_cache = helpers.LRUCache(maxsize=1024) # caching text2sql results: (nl, db_id) -> sql
+            self.sql2nl_cache = helpers.LRUCache(maxsize=1024) # caching sql2nl results: sql -> nl
+            self.parse_cache = helpers.LRUCache(maxsize=512) # caching parsed sqls: (sql, db_id) -> {"sql_parse": ..., "table": ...}
+            self.decode_cache = helpers.LRUCache(maxsize=4096) # caching decoded sqls: (sql, db_id) -> decoded clauses
+            self.db_conns = {} # sqlite connections reused across queries: db_id -> connection
+            self.db_info_cache = {} # caching table/column info built from tables.json: db_id -> tables
+            self.db_tables_cache = {} # caching table columns grouped per table: db_id -> {table: cols}
+            self.db_cols_cache = {} # caching meaningful (non-key) columns: db_id -> ["table: col", ...]
         else:
             raise Exception("currently only support spider dataset")
         return
@@ -94,6 +101,8 @@ class DataService(object):
             print("=== finish loading sql suggestion model ===")
 
     def get_db_info(self, db_id):
+        if db_id in self.db_info_cache:
+            return self.db_info_cache[db_id]
         db_info = self.db_meta_dict[db_id]
         table_info_list = []
         for i, tabel_name in enumerate(db_info['table_names_original']):
@@ -103,18 +112,22 @@ class DataService(object):
                 'primary_key': db_info['primary_keys'][i],
                 'columns': []
             }
-            for col_i, col in enumerate(db_info['column_names_original']):
-                if col[0] == i:
-                    table_info['columns'].append({
-                        'id': col[1],
-                        'name': db_info['column_names'][col_i][1],
-                        'type': db_info['column_types'][col_i]
-                    })
             table_info_list.append(table_info)
+        # assign every column to its table in a single pass
+        for col_i, col in enumerate(db_info['column_names_original']):
+            if col[0] >= 0:
+                table_info_list[col[0]]['columns'].append({
+                    'id': col[1],
+                    'name': db_info['column_names'][col_i][1],
+                    'type': db_info['column_types'][col_i]
+                })
+        self.db_info_cache[db_id] = table_info_list
         return table_info_list
 
     def get_tables(self, db_id):
         self.db_id = db_id
+        if db_id in self.db_tables_cache:
+            return self.db_tables_cache[db_id]
         db_info = self.db_meta_dict[db_id]
         # print(db_info.keys())
         tkeys = set(db_info["primary_keys"]).union(set([k for kp in db_info["foreign_keys"] for k in kp]))
@@ -136,6 +149,7 @@ class DataService(object):
         for dk in db_dict.keys():
             db_dict[dk] = sorted(db_dict[dk], key=lambda x: x[1])
         # print(db_dict)
+        self.db_tables_cache[db_id] = db_dict
         return db_dict
 
     def get_cols(self, table_name):
@@ -157,7 +171,7 @@ class DataService(object):
         - Output: 
             - table col names: ["table name: col names", ...]
         """
-        if db_id not in self.h_q.keys():
+        if db_id not in self.db_cols_cache:
             db_info = self.db_meta_dict[db_id]
             pk = db_info["primary_keys"] # primary keys
             fk = db_info["foreign_keys"] # foreign keys
@@ -168,38 +182,60 @@ class DataService(object):
             # print("k_set: ", k_set)
             table_names = db_info["table_names"]
             # remove columns that included in primary keys and foreign keys since they usually do not carry many meanings
-            table_cols = [table_names[col[0]] + ": " + col[1] for colidx, col in enumerate(db_info["column_names"]) if col[0]!=-1 and colidx not in list(k_set)]
-            self.table_cols = table_cols
+            table_cols = [table_names[col[0]] + ": " + col[1] for colidx, col in enumerate(db_info["column_names"]) if col[0]!=-1 and colidx not in k_set]
+            self.db_cols_cache[db_id] = table_cols
             # print(table_cols)
-            
+
+        self.table_cols = self.db_cols_cache[db_id]
         return self.table_cols
 
-    def get_col_names(self, file_name, table_name):
-        conn = sqlite3.connect(file_name)
-        col_data = conn.execute(f'PRAGMA table_info({table_name});').fetchall()
-        conn.close()
-        return [entry[1] for entry in col_data]
+    def get_db_conn(self, db_id):
+        """
+        get a (cached) sqlite connection to the database
+        - Input:
+            - db_id: database name
+        - Output:
+            - sqlite3 connection, opened once and reused by later queries
+        """
+        if db_id not in self.db_conns:
+            db_path = os.path.join(GV.SPIDER_FOLDER, f"database/{db_id}/{db_id}.sqlite")
+            self.db_conns[db_id] = sqlite3.connect(db_path, check_same_thread=False)
+        return self.db_conns[db_id]
 
     def load_table_content(self, table_name):
-        db_path = os.path.join(GV.SPIDER_FOLDER, f"database/{self.db_id}/{self.db_id}.sqlite")
-        con = sqlite3.connect(db_path)
-        cur = con.cursor()
-        cur.row_factory = sqlite3.Row
-        col_names = self.get_col_names(db_path, table_name)
+        cur = self.get_db_conn(self.db_id).cursor()
+        cur.execute(f"select * from {table_name}")
+        # column names come with the result set, no extra PRAGMA query needed
+        col_names = [desc[0] for desc in cur.description]
         table_data = []
-        for rowid, row in enumerate(cur.execute(f"select * from {table_name}").fetchall()):
-            row_dict = {}
-            for eleidx, ele in enumerate(row):
-                row_dict[col_names[eleidx]] = ele
+        for rowid, row in enumerate(cur.fetchall()):
+            row_dict = dict(zip(col_names, row))
             row_dict["id"] = rowid
             table_data.append(row_dict)
+        cur.close()
         return table_data
 
     def text2sql(self, q, db_id):
+        sql = self.text2sql_cache.get((q, db_id))
+        if sql is not None:
+            return sql
         self._load_text2sql_model()
         sql = self.text2sql_model.predict(q, db_id)
+        self.text2sql_cache[(q, db_id)] = sql
         return sql
 
+    def text2sql_batch(self, qs, db_id):
+        # only run the model on questions that are not cached yet
+        # results are collected locally, the bounded cache may evict entries of a large batch
+        sqls = {q: self.text2sql_cache.get((q, db_id)) for q in qs}
+        misses = [q for q, sql in sqls.items() if sql is None]
+        if len(misses) > 0:
+            self._load_text2sql_model()
+            for q, sql in zip(misses, self.text2sql_model.predict_batch(misses, db_id)):
+                self.text2sql_cache[(q, db_id)] = sql
+                sqls[q] = sql
+        return [sqls[q] for q in qs]
+
     def parsesql(self, sql, db_id):
         """parse sql data based on spider database
         sql: sql query
@@ -207,12 +243,30 @@ class DataService(object):
         return: {"sql_parse": sql_label, "table": table}
         """
         if self.dataset == "spider":
+            # the same sql is parsed by set_query_context, sql2data and sql2text (via decodesql)
+            parsed = self.parse_cache.get((sql, db_id))
+            if parsed is not None:
+                return parsed
             self._load_sql_parser()
             parsed = self.sql_parser.parse_sql(sql, db_id)
+            self.parse_cache[(sql, db_id)] = parsed
             return parsed
         else:
             raise Exception(f"Can not support {self.dataset} dataset")
 
+    def decodesql(self, sql, db_id):
+        """parse and decode a sql query, the decoded clauses are shared and must not be modified
+        sql: sql query
+        db_id: db name in Spider database
+        return: decoded sql (dict of clauses)
+        """
+        decoded = self.decode_cache.get((sql, db_id))
+        if decoded is None:
+            sql_parse = self.parsesql(sql, db_id)
+            decoded = decode_sql(sql_parse["sql_parse"], sql_parse["table"])
+            self.decode_cache[(sql, db_id)] = decoded
+        return decoded
+
     def init_query_context(self, db_id):
         self.h_q[db_id] = {}
         self.h_q[db_id]["select"] = []
@@ -227,19 +281,18 @@ class DataService(object):
         - db_id: database name (str)
         """
         # TODO: dont update context if already exists in the history
-        sql_parse = self.parsesql(sql, db_id)
-        sql_decoded = decode_sql(sql_parse["sql_parse"], sql_parse["table"])
+        sql_decoded = self.decodesql(sql, db_id)
         select_ents = extract_select_names(sql_decoded["select"])
         groupby_ents = extract_groupby_names(sql_decoded["groupBy"])
         agg_dict = extract_agg_opts(sql_decoded["select"])
-        table_cols = self.get_db_cols(db_id) # meaningful columns
+        table_cols = set(self.get_db_cols(db_id)) # meaningful columns (set for membership tests)
         # print("select ents: ", select_ents)
         # print("groupby ents: ", groupby_ents)
         # print("agg dict: ", agg_dict)
         # print(f"table_cols: {table_cols}")
 
         self.cur_q = [sql, db_id]
-        if db_id not in self.h_q.keys():
+        if db_id not in self.h_q:
             self.init_query_context(db_id)
         # ensure entities are in the table columns (exclude the foreig/primary keys)
         self.h_q[db_id]["select"].append([ent for ent in select_ents if ent in table_cols])
@@ -261,8 +314,7 @@ class DataService(object):
         ### Output:
         - suggestion
         """
-        if db_id in self.h_q.keys():
-            context_dict = self.h_q[db_id]
+        context_dict = self.h_q.get(db_id, context_dict)
 
         # database meta data
         db_meta = self.db_meta_dict[db_id]
@@ -279,17 +331,18 @@ class DataService(object):
 
         nls_prompts = generate_sql.compile_sql(sugg_dict)
         # print("nls: {}".format(nls))
-        sqls = [self.text2sql(nl, db_id) for nl in nls_prompts]
-        sql2nls =  [self.sql2nl(sql) for sql in sqls]      
+        sqls = self.text2sql_batch(nls_prompts, db_id)
+        sql2nls = self.sql2nl_batch(sqls)
         # print("sql2nls: {}, type: {}".format(sql2nls, type(sql2nls[0])))
         return {
             "sql": sqls,
             "nl": sql2nls
         }
 
-    def data2vl(self, data):
+    def data2vl(self, data, data_values=None):
         """Get VegaLite specifications from tabular-style data.
         data: pd.DataFrame, data to be presented
+        data_values: `data` as a list of records, computed from `data` when not given
         """
         data_types = {column: helpers.get_attr_type(data[column].tolist()) for column in data}
 
@@ -299,6 +352,9 @@ class DataService(object):
             raise ValueError("Unsupported data combinations")
 
         vl_specs = []
+        # the data values are identical for every design, serialize them once
+        if data_values is None:
+            data_values = data.to_dict('records')
 
         for d_counter in range(len(vis_design_combos[attr_type_str]["designs"])):
 
@@ -345,46 +401,64 @@ class DataService(object):
             # ------------------
 
             # Combine the data
-            vl_genie_instance.vl_spec['data'] = {'values': data.to_dict('records')}
+            vl_genie_instance.vl_spec['data'] = {'values': data_values}
             vl_specs.append(vl_genie_instance.vl_spec)
 
         return vl_specs
 
+    def sql2rows(self, sql, db_id):
+        """execute sql and return the result rows as a list of lists"""
+        cur = self.get_db_conn(db_id).cursor()
+        data = [list(d) for d in cur.execute(sql).fetchall()]
+        cur.close()
+        return data
+
     def sql2data(self, sql, db_id):
-        sql_parsed = self.parsesql(sql, db_id)
-        sql_decoded = decode_sql(sql_parsed["sql_parse"], sql_parsed["table"])
+        sql_decoded = self.decodesql(sql, db_id)
         identifiers = [ident.replace('\'s', '') \
                        for ident in helpers.get_sql_identifiers(sql_decoded["select"])]
 
-        db_path = os.path.join(GV.SPIDER_FOLDER, f"database/{db_id}/{db_id}.sqlite")
-        con = sqlite3.connect(db_path)
-        cur = con.cursor()
-        data = [list(d) for d in cur.execute(sql).fetchall()]
-        con.close()
-
-        data = pd.DataFrame(data, columns=identifiers)
+        data = pd.DataFrame(self.sql2rows(sql, db_id), columns=identifiers)
         return data
 
     def sql2vl(self, sql, db_id, return_data=False):
         data = self.sql2data(sql, db_id)
+        # when the data is returned too, its records are shared with the vega-lite specs;
+        # otherwise data2vl builds them only if it needs them
+        records = data.to_dict('records') if return_data else None
         if data.shape == (1, 1):
             response = data.values[0][0]
         else:
             try:
-                response = self.data2vl(data)
+                response = self.data2vl(data, records)
             except ValueError:
                 warnings.warn("Unsupported data type. Show the results in tables instead.")
                 response = data
         if return_data:
-            return {'data': data, 'vl': response}
+            return {'data': data, 'records': records, 'vl': response}
         else:
             return response
 
     def sql2nl(self, sql: str):
+        nl = self.sql2nl_cache.get(sql)
+        if nl is not None:
+            return nl
         self._load_sql2text_model()
         nl = self.sql2text_model.sql2text(sql)
+        self.sql2nl_cache[sql] = nl
         return nl
 
+    def sql2nl_batch(self, sqls):
+        # different suggestions can compile to the same sql, only describe each new sql once
+        nls = {sql: self.sql2nl_cache.get(sql) for sql in sqls}
+        misses = [sql for sql, nl in nls.items() if nl is None]
+        if len(misses) > 0:
+            self._load_sql2text_model()
+            for sql, nl in zip(misses, self.sql2text_model.sql2text_batch(misses)):
+                self.sql2nl_cache[sql] = nl
+                nls[sql] = nl
+        return [nls[sql] for sql in sqls]
+
 if __name__ == '__main__':
     print('dataService:')
     dataService = DataService("spider")
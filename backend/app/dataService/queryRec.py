@@ -1,10 +1,12 @@
 import os
 import sys
 import re
-import json
+import logging
 import numpy as np
 import pandas as pd
 import math
+import threading
+import torch
 
 from sentence_transformers import SentenceTransformer, util
 from mlxtend.frequent_patterns import fpmax, fpgrowth
@@ -12,27 +14,51 @@ from sklearn.metrics.pairwise import cosine_similarity
 
 try:
     import globalVariable as GV
+    from utils import helpers
     from utils.processSQL import process_sql, decode_sql, generate_sql
     from utils.processSQL.decode_sql import extract_select_names, extract_agg_opts, extract_groupby_names
 except ImportError:
     import app.dataService.globalVariable as GV
+    from app.dataService.utils import helpers
     from app.dataService.utils.processSQL import process_sql, decode_sql, generate_sql
     from app.dataService.utils.processSQL.decode_sql import extract_select_names, extract_agg_opts, extract_groupby_names
+
+LOG = logging.getLogger(__name__)
+
+DIGITS_RE = re.compile(r'[0-9]+')
+
+
+def clean_name(name):
+    """normalize a spider db name for matching, e.g. `flight_1` -> `flight`"""
+    return DIGITS_RE.sub('', name.replace("_", " ")).strip().lower()
+
+
 # TODO: data type checking and loading before recommendation
 class queryRecommender(object):
+    # sentence encoder shared by all recommenders, loaded on first use
+    _model = None
+    _model_lock = threading.Lock()
+
+    @classmethod
+    def get_model(cls):
+        if cls._model is None:
+            with cls._model_lock:
+                if cls._model is None:
+                    cls._model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
+                    # cls._model = SentenceTransformer('paraphrase-MiniLM-L12-v2')
+        return cls._model
+
     # TODO Check: handle change of database
     def __init__(self, topic_sim_th=0.55, item_sim=0.4, alpha=0.9, beta=0.5,
                  groupby_th=0.7, agg_th=0.5, sim=0.7,
                  opt_n = 1,
                  ref_db_meta_path=os.path.join(GV.SPIDER_FOLDER, "train_spider.json")):
         self.GV = GV
-        self.model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-        # self.model = SentenceTransformer('paraphrase-MiniLM-L12-v2')
+        self.model = self.get_model()
 
         self.db_schema, self.db_names, self.tables = process_sql.get_schemas_from_json(
             os.path.join(GV.SPIDER_FOLDER, "tables.json"))
-        self.db_new_names = [re.sub(r'[0-9]+', '', n.replace("_", " ")).strip().lower() for n in
-                             self.db_names]
+        self.db_new_names = list(map(clean_name, self.db_names))
 
         # --- parameter setting
         self.topic_sim_th = topic_sim_th
@@ -44,13 +70,15 @@ class queryRecommender(object):
         self.beta = beta
         self.opt_n = opt_n
         # --- reference database
-        with open(ref_db_meta_path, "r") as f:
-            ref_db_data = pd.DataFrame(json.load(f))
+        ref_db_data = pd.DataFrame(helpers.load_json(ref_db_meta_path))
         self.dataset = ref_db_data
         # --- target table to search
         # self.search_cols = search_cols
         self.db_cache = {} # caching search results
         self.g_cols_cache = {}
+        self.col_groups_cache = {} # caching column clusters: tuple(columns) -> groups
+        self.decoded_sql_cache = {} # caching decoded reference sqls: (db_id, query) -> decoded sql
+        self.embed_cache = {} # caching sentence embeddings: sentence -> tensor
         # ---- pre-selected
         self.pre_sel = []
 
@@ -71,12 +99,44 @@ class queryRecommender(object):
             sen1 = ["".join(s.split(":")[1:]) if ":" in s else s for s in sen1]
         elif isinstance(sen1, str):
             sen1 = "".join(sen1.split(":")[1:]) if ":" in sen1 else sen1
-        embedd0 = self.model.encode(sen0, convert_to_tensor=True)
-        embedd1 = self.model.encode(sen1, convert_to_tensor=True)
+        embedd0 = self.encode(sen0)
+        embedd1 = self.encode(sen1)
         cosine_scores = util.pytorch_cos_sim(embedd0, embedd1).cpu().numpy()
         return cosine_scores
 
 
+    def decode_ref_sql(self, row):
+        """
+        - decode the sql of a reference query, the same rows are revisited on every suggestion round
+        - INPUT:
+          - row: a row of the reference dataset
+        - OUTPUT:
+          - decoded sql (dict)
+        """
+        key = (row["db_id"], row["query"])
+        if key not in self.decoded_sql_cache:
+            self.decoded_sql_cache[key] = decode_sql(row["sql"], self.tables[row["db_id"]])
+        return self.decoded_sql_cache[key]
+
+    def encode(self, sentences):
+        """
+        - embed sentences, only sentences that are not cached yet are sent to the model (once, in one batch)
+        - INPUT:
+          - sentences: list of str or single str
+        - OUTPUT:
+          - embedding tensor (one row per sentence, or a single vector for a str)
+        """
+        if isinstance(sentences, str):
+            return self.encode([sentences])[0]
+        sentences = list(sentences)
+        if len(sentences) == 0:
+            return self.model.encode(sentences, convert_to_tensor=True)
+        misses = list(dict.fromkeys(s for s in sentences if s not in self.embed_cache))
+        if len(misses) > 0:
+            for s, embedding in zip(misses, self.model.encode(misses, convert_to_tensor=True)):
+                self.embed_cache[s] = embedding
+        return torch.stack([self.embed_cache[s] for s in sentences])
+
     def search_sim_dbs(self, topic, search_cols):
         """
         - retrieve similar db according to query table names
@@ -87,41 +147,47 @@ class queryRecommender(object):
           - dataframe of similar dbs in the dataset
         """
         ############## cluster input columns based on their semantic meanings
-        cols_groups = self.get_grouped_cols(search_cols)
-        self.g_cols_cache = cols_groups
+        # the same database columns are sent on every suggestion round, skip re-clustering them
+        cols_key = tuple(search_cols)
+        if cols_key not in self.col_groups_cache:
+            self.col_groups_cache[cols_key] = self.get_grouped_cols(search_cols)
+        self.g_cols_cache = self.col_groups_cache[cols_key]
         #################################################
 
-        if topic in self.db_cache.keys():
-            return self.db_cache[topic]
+        cached = self.db_cache.get(topic)
+        if cached is not None:
+            return cached
 
         self.search_cols = search_cols
         sim_scores = self.cal_cosine_sim(topic, self.db_new_names)[0]
-        related_db_names = [self.db_names[i] for i in np.where(sim_scores > self.topic_sim_th)[0]]
-        print(f"related_db_names: {related_db_names}")
+        related_db_names = {self.db_names[i] for i in np.where(sim_scores > self.topic_sim_th)[0]}
+        LOG.debug("related_db_names: %s", related_db_names)
+        related_rows = self.dataset[self.dataset["db_id"].isin(related_db_names)]
+        rowids = list(related_rows.index)
+        # entity in `select` clause
+        row_ents = [extract_select_names(self.decode_ref_sql(row)["select"])
+                    for _, row in related_rows.iterrows()]
+        # calculate similarity between all distinct `select` items and `select` cols at once,
+        # then take the maximum over each row's items
+        all_ents = list(dict.fromkeys(ent for ents in row_ents for ent in ents))
+        ent_idx = {ent: i for i, ent in enumerate(all_ents)}
         row_sims = []
-        rowids = []
-        for rowid, row in self.dataset.iterrows():
-            if row["db_id"] in related_db_names:
-                rowids.append(rowid)
-                # entity in `select` clause
-                # print(row["sql"])
-                select_decoded = decode_sql(row["sql"], self.tables[row["db_id"]])["select"]
-                select_ents = extract_select_names(select_decoded)
-                # calculate similarity between `select` items and `select` cols
-                row_sim = self.cal_cosine_sim(self.search_cols, select_ents)
-                row_sims.append(np.max(row_sim, axis=1))
+        if len(all_ents) > 0:
+            ent_sims = self.cal_cosine_sim(self.search_cols, all_ents)
+            row_sims = [np.max(ent_sims[:, [ent_idx[ent] for ent in ents]], axis=1) for ents in row_ents]
         db_df_bin = pd.DataFrame(np.where(np.array(row_sims) > self.item_sim, 1, 0),
                                  columns=self.search_cols)
         self.ref_db = (self.dataset.loc[rowids]).reset_index(drop=True)
-        sim_sum = [sum(db_df_bin[col]) for col in db_df_bin.columns]
-        db_df_bin = db_df_bin[db_df_bin.columns[(-np.array(sim_sum)).argsort()]]
+        # column-wise relevance counts in one vectorized reduction
+        sim_sum = db_df_bin.sum(axis=0).values
+        db_df_bin = db_df_bin[db_df_bin.columns[(-sim_sum).argsort()]]
         ######################################################################
         
         self.db_cache[topic] = db_df_bin
         return db_df_bin
 
     def get_grouped_cols(self, columns, min_size = 2, th = 0.8):
-        corpus_embeddings = self.model.encode(columns, convert_to_tensor=False)
+        corpus_embeddings = self.encode(columns).cpu()
         clusters = util.community_detection(corpus_embeddings, min_community_size = min_size, threshold = th, init_max_size=3)
         col_groups = [set([columns[c] for c in cluster]) for cluster in clusters]
         col_groups += GV.col_combo
@@ -203,15 +269,13 @@ class queryRecommender(object):
             all_groupby_names = []
             agg_list = []
             for rowid, row in self.ref_db.iloc[col_mul_idx].iterrows():
-                db_id = row["db_id"]
-                table = self.tables[db_id]
-                sql = row["sql"]
+                sql_decoded = self.decode_ref_sql(row)
                 # extract `groupby` entities
                 # groupby_decoded = decode_sql.decode_groupby(sql["groupBy"], table)
-                groupby_decoded = decode_sql(sql, table)["groupBy"]
+                groupby_decoded = sql_decoded["groupBy"]
                 groupby_names = extract_groupby_names(groupby_decoded)
                 # extract `agg` operations
-                select_decoded = decode_sql(sql, table)["select"]
+                select_decoded = sql_decoded["select"]
                 # select_decoded = decode_sql.decode_select(sql, table)
                 agg_dict = extract_agg_opts(select_decoded)
                 agg_list.append(agg_dict)
@@ -257,7 +321,7 @@ class queryRecommender(object):
                     # print("agg_opt: ", agg_opt)
                     # calculate `agg` context relevance
                     ################################################################
-                    agg_l = [agg_c[agg_opt] for agg_c in agg_contexts if agg_opt in agg_c.keys()]
+                    agg_l = [agg_c[agg_opt] for agg_c in agg_contexts if agg_opt in agg_c]
                     agg_l = np.concatenate(agg_l) if len(agg_l) > 0 else agg_l
                     if len(agg_l) > 0:
                         agg_context_sim = np.max(self.cal_cosine_sim(agg_l, col), axis=0)
@@ -268,7 +332,7 @@ class queryRecommender(object):
                         # print("-*-"*10)
                         # print("agg_col: ", agg_col)
                         # print("-*-"*10)
-                        if agg_opt not in agg_sugg_dict.keys():
+                        if agg_opt not in agg_sugg_dict:
                             agg_sugg_dict[agg_opt] = []
                         agg_sugg_dict[agg_opt] += (agg_col)
                         # print("type(agg_col)",type(agg_col), agg_col, agg_sugg_dict[agg_opt])
@@ -290,7 +354,7 @@ class queryRecommender(object):
                         agg_c_sim = np.mean(self.cal_cosine_sim(a_l, col), axis=0)
                         for g_sim, c in zip(agg_c_sim, col):
                             if g_sim > self.agg_th:
-                                if agg_opt not in agg_sugg_dict.keys():
+                                if agg_opt not in agg_sugg_dict:
                                     agg_sugg_dict[agg_opt] = []
                                 if c not in agg_sugg_dict[agg_opt]:
                                     # select top one count
@@ -342,14 +406,14 @@ class queryRecommender(object):
             
             if len(union_set) < top_n:
                 rest_cols = db_df_bin.columns.difference(list(union_set))
-                sim_sum = [sum(db_df_bin[col]) for col in rest_cols]
+                sim_sum = db_df_bin[rest_cols].sum(axis=0).values
                 # sort columns according to their overall database relevance
                 cols_supp = []
                 #############################################
                 ########## recommend similar columns (grouped based on their semantic meaning)
-                for col in db_df_bin[rest_cols[(-np.array(sim_sum)).argsort()]].columns:
+                for col in db_df_bin[rest_cols[(-sim_sum).argsort()]].columns:
                     if len(cols_supp) < top_n - len(union_set):
-                        if sum([col in c for c in cols_supp]) == 0:
+                        if not any(col in c for c in cols_supp):
                             curr_set = [col]
                             # check `max_len` constraints
                             for c in self.g_cols_cache:
@@ -397,10 +461,8 @@ class queryRecommender(object):
                             sel_pre = [[]]
                         else:
                             sel_pre = [sel_contexts[-1]]
-                        print("---"*10)
                         # print("sel_contexts, self.pre_sel: ", sel_contexts, self.pre_sel)
-                        print("prev cols, groupby_sugg, agg_sugg: ", sel_contexts[-1], groupby_sugg, agg_sugg)
-                        print("---"*10)
+                        LOG.debug("prev cols, groupby_sugg, agg_sugg: %s %s %s", sel_contexts[-1], groupby_sugg, agg_sugg)
         # 
         # if len(context_cols) > 0:
         #     groupby_sugg_, agg_sugg_ = self.get_opts(db_df_bin, [context_cols], groupby_contexts,
@@ -413,16 +475,14 @@ class queryRecommender(object):
             # print("context: ", context)
             # print()
             if len(context)>0:
+                decay = math.pow(self.alpha, len(sel_contexts) - contextid - 1)  # shared by both scores
                 # 1. consider semantic similarity
-                semantic_sim_scores = np.max(self.cal_cosine_sim(rest_cols, context),
-                                            axis=1) * math.pow(self.alpha,
-                                                                len(sel_contexts) - contextid - 1)
+                semantic_sim_scores = np.max(self.cal_cosine_sim(rest_cols, context), axis=1) * decay
                 # print("semantic_sim_scores: ", semantic_sim_scores)
                 # 2. consider cosine similarity between feature vectors (relevance vector to the database)
                 db_col_feat = db_df_bin[rest_cols].T
                 context_feat = db_df_bin[context].T
-                db_relevance = np.max(cosine_similarity(db_col_feat, context_feat), axis=1) * math.pow(
-                    self.alpha, len(sel_contexts) - contextid - 1)
+                db_relevance = np.max(cosine_similarity(db_col_feat, context_feat), axis=1) * decay
                 # print("db_relevance: ", db_relevance)
                 # 3. average similarity based on semantic similarity and db relevance
                 all_sims += semantic_sim_scores + self.beta * db_relevance
@@ -440,11 +500,10 @@ class queryRecommender(object):
                                          filter_set=set(context_cols), support=support, max_len = max_len)
         freq_cols = [list(v) for v in freq_combo["itemsets"].values if len(v) > 0]
         ##########################################
+        # columns already suggested, kept up to date instead of re-concatenating `freq_cols` per column
+        total_cols = {c for fc in freq_cols for c in fc}
         for col in rest_cols:
             if len(freq_cols) < top_n:
-                total_cols = []
-                if len(freq_cols) > 0:
-                    total_cols = np.concatenate(freq_cols)
                 if col not in total_cols:
                     curr_set = [col]
                     for c in self.g_cols_cache:
@@ -452,6 +511,7 @@ class queryRecommender(object):
                             curr_set += list(c.difference([col]))[:max_len-2]
                     # print("col not in total cols: ", curr_set)
                     freq_cols.append(curr_set)
+                    total_cols.update(curr_set)
             else:
                 freq_cols = freq_cols[:top_n]
                 break
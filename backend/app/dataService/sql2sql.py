@@ -34,6 +34,10 @@ def set_seed(seed):
 seed_number = 42
 set_seed(seed_number)
 
+# text cleaning patterns shared by the datasets, compiled once at import
+REPLACE_NO_SPACE = re.compile("[.;:!\'?,\"()\[\]]")
+REPLACE_WITH_SPACE = re.compile("(<br\s*/><br\s*/>)|(\-)|(\/)")
+
 
 class T5FineTuner(pl.LightningModule):
   def __init__(self, hparams):
@@ -195,9 +199,6 @@ class ImdbDataset(Dataset):
     return {"source_ids": source_ids, "source_mask": src_mask, "target_ids": target_ids, "target_mask": target_mask}
   
   def _build(self):
-    REPLACE_NO_SPACE = re.compile("[.;:!\'?,\"()\[\]]")
-    REPLACE_WITH_SPACE = re.compile("(<br\s*/><br\s*/>)|(\-)|(\/)")
-
     print("len(self.dataset_split): {}".format(len(self.dataset_split)))
     for row in self.dataset_split:
       # print(row)
@@ -255,9 +256,6 @@ class SeqSpiderDataset(Dataset):
 
         return {"source_ids": source_ids, "source_mask": src_mask, "target_ids": target_ids, "target_mask": target_mask}
     def _build(self):
-        REPLACE_NO_SPACE = re.compile("[.;:!\'?,\"()\[\]]")
-        REPLACE_WITH_SPACE = re.compile("(<br\s*/><br\s*/>)|(\-)|(\/)")
-
         keywords = ["*", "avg", "min", "max", "count", "+", "-", "/", "select", "groupby"]
     
         for rs, rt, rm in zip(self.source, self.target, self.meta):
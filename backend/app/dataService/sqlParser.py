@@ -43,15 +43,21 @@ from transformers import AutoTokenizer
 from UnifiedSKG.utils.configue import Configure
 from UnifiedSKG.models.unified.prefixtuning import Model
 
+# prompt format expected by the UnifiedSKG sql2text model
+SQL2NL_PROMPT = "{} ; structed knowledge: {}"
+
+
 class SQLParser(object):
     def __init__(self):
         self.db = GV.SPIDER_FOLDER
         self.db_schema, self.db_names, self.tables = process_sql.get_schemas_from_json(os.path.join(self.db, "tables.json"))
+        self.schema_cache = {} # Schema (with its id map) built once per database
         
     def parse_sql(self, sql="SELECT name ,  country ,  age FROM singer group by country having count(*) > 2", db_id="concert_singer"):
-        schema = self.db_schema[db_id]
         table = self.tables[db_id]
-        schema = process_sql.Schema(schema, table)
+        if db_id not in self.schema_cache:
+            self.schema_cache[db_id] = process_sql.Schema(self.db_schema[db_id], table)
+        schema = self.schema_cache[db_id]
 
         sql_label = process_sql.get_sql(schema, sql)
         # print("sql_label: {}".format(sql_label))
@@ -73,11 +79,18 @@ class SmBop(object):
         self.predictor = Predictor.from_path(GV.SMBOP_PATH, cuda_device=-1, overrides=overrides)
 
     def predict(self, q, db_id):
-        instance = self.predictor._dataset_reader.text_to_instance(utterance=q, db_id=db_id)
-        self.predictor._dataset_reader.apply_token_indexers(instance)
+        return self.predict_batch([q], db_id)[0]
+
+    def predict_batch(self, qs, db_id):
+        """translate a list of questions on the same database in one forward pass"""
+        instances = []
+        for q in qs:
+            instance = self.predictor._dataset_reader.text_to_instance(utterance=q, db_id=db_id)
+            self.predictor._dataset_reader.apply_token_indexers(instance)
+            instances.append(instance)
         with torch.cuda.amp.autocast(enabled=True):
-            out = self.predictor._model.forward_on_instances([instance])
-            return out[0]["sql_list"]
+            out = self.predictor._model.forward_on_instances(instances)
+            return [o["sql_list"] for o in out]
 
 
 class SQL2NL(object):
@@ -87,10 +100,15 @@ class SQL2NL(object):
         self.model = Model(args)
         self.model.load(GV.SQL2NL_MODEL_NAME)
     def sql2text(self, sql: str = "SELECT name ,  country ,  age FROM singer ORDER BY age DESC"):
+        return self.sql2text_batch([sql])[0]
+
+    def sql2text_batch(self, sqls):
+        """translate a list of sqls with a single generate call"""
         prefix = ""
-        prompt = "{} ; structed knowledge: {}".format(sql, prefix)
-        tokenized_txt = self.tokenizer([prompt], max_length=1024, padding="max_length", truncation=True)
-        pred = self.tokenizer.batch_decode(
+        prompts = [SQL2NL_PROMPT.format(sql, prefix) for sql in sqls]
+        # pad to the longest prompt only, padding to max_length feeds ~1000 pad tokens to the encoder
+        tokenized_txt = self.tokenizer(prompts, max_length=1024, padding="longest", truncation=True)
+        preds = self.tokenizer.batch_decode(
             self.model.generate(
                 torch.LongTensor(tokenized_txt.data['input_ids']),
                 torch.LongTensor(tokenized_txt.data['attention_mask']),
@@ -99,7 +117,7 @@ class SQL2NL(object):
                 ), 
             skip_special_tokens=True 
         )
-        return pred[0]
+        return preds
 
 if __name__=='__main__':
     # smbop = SmBop()
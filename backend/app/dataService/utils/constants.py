@@ -182,6 +182,19 @@ vl_attribute_types = {
     'O': 'ordinal',
 }
 
+# Map of "visualizations" to their Vega-Lite mark types
+vl_mark_types = {
+    'histogram': 'bar',
+    'barchart': 'bar',
+    'linechart': 'line',
+    'areachart': 'area',
+    'scatterplot': 'point',
+    'boxplot': 'boxplot',
+    'stripplot': 'tick',
+    'piechart': 'arc',
+    'donutchart': 'arc',
+}
+
 # Regular Expressions with their corresponding FORMATs and Examples
 date_regexes = [
     # Format:
@@ -1,9 +1,18 @@
+import os
 import re
-import sqlparse
 import json
+import math
+import tempfile
 import numpy as np
 
+from collections import OrderedDict
 from datetime import date, datetime
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 try:
     from app.dataService.utils import constants
@@ -44,20 +53,32 @@ def isint(datum):
     return a == b
 
 
+# date patterns are compiled once, `isdate` runs for every cell of a query result
+date_regexes_compiled = [re.compile(regex_list[1]) for regex_list in constants.date_regexes]
+
+
+# result columns repeat the same values a lot, so remember which pattern a string matched
+@lru_cache(maxsize=8192)
+def match_date_regex(text):
+    for idx, regex in enumerate(date_regexes_compiled):
+        match = regex.match(text)
+        if match is not None:
+            return idx, match.groups()
+    return None
+
+
 # Copied from NL4DV
 def isdate(datum):
     try:
         if datum == '' or str(datum).isspace():
             return False, None
 
-        for idx, regex_list in enumerate(constants.date_regexes):
-            regex = re.compile(regex_list[1])
-            match = regex.match(str(datum))
-            if match is not None:
-                dateobj = dict()
-                dateobj["regex_id"] = idx
-                dateobj["regex_matches"] = list(match.groups())
-                return True, dateobj
+        matched = match_date_regex(str(datum))
+        if matched is not None:
+            dateobj = dict()
+            dateobj["regex_id"] = matched[0]
+            dateobj["regex_matches"] = list(matched[1])
+            return True, dateobj
 
     except Exception as e:
         pass
@@ -93,6 +114,78 @@ class CustomJSONEncoder(json.JSONEncoder):
 
 # -------------------------------------New Edition---------------------------------------
 
+# mode of a file created with a plain open(): tempfile creates 0600 files, dump_json restores this
+_umask = os.umask(0)
+os.umask(_umask)
+default_file_mode = 0o666 & ~_umask
+
+class LRUCache(OrderedDict):
+    """dict with a size limit, the least recently used entry is dropped once `maxsize` is exceeded"""
+    def __init__(self, maxsize=1024):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+def load_json(fpath):
+    """load a json file, using orjson for parsing when it is installed"""
+    if orjson is not None:
+        with open(fpath, "rb") as f:
+            return orjson.loads(f.read())
+    with open(fpath, "r") as f:
+        return json.load(f)
+
+
+def _orjson_compatible(obj):
+    """mirror orjson's defaults for the stdlib fallback: str keys only, NaN/Infinity become null"""
+    if isinstance(obj, dict):
+        for key in obj:
+            if not isinstance(key, str):
+                raise TypeError("Dict key must be str")
+        return {key: _orjson_compatible(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_orjson_compatible(value) for value in obj]
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+
+def dump_json(data, fpath):
+    """write data to a json file, using orjson for serialization when it is installed
+
+    The file is written to a unique temporary sibling and then swapped in with
+    os.replace, so readers never see a half-written file.
+    """
+    if orjson is not None:
+        payload = orjson.dumps(data)
+    else:
+        # same bytes as orjson: compact separators, raw utf-8
+        payload = json.dumps(_orjson_compatible(data), separators=(",", ":"),
+                             ensure_ascii=False).encode("utf-8")
+    tmp = tempfile.NamedTemporaryFile(mode="wb", suffix=".tmp",
+                                      dir=os.path.dirname(fpath) or ".", delete=False)
+    try:
+        with tmp as f:
+            f.write(payload)
+        os.chmod(tmp.name, default_file_mode)
+        os.replace(tmp.name, fpath)
+    finally:
+        # only left behind when the write or the replace failed
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+
+
 def is_numeric(obj):
     attrs = ['__add__', '__sub__', '__mul__', '__truediv__', '__pow__']
     return all(hasattr(obj, attr) for attr in attrs)
@@ -15,14 +15,15 @@ def compile_select_from(s, db_meta):
     sel_l = [] # select enetity list
     
     for s_el in s:
+        s_parts = s_el.split(":") # split each "table: column" entity once
         # table name checking
-        s_table = s_el.split(":")[0].strip()
+        s_table = s_parts[0].strip()
         s_table_idx = table_names.index(s_table)
         s_table_name = table_names_original[s_table_idx]
         if s_table_name not in table_l:
             table_l.append(s_table_name)
         # column name checking
-        s_col = s_el.split(":")[1].strip()
+        s_col = s_parts[1].strip()
         s_col_name = "*"
         if s_col != "*":
             for cidx, c in enumerate(db_meta["column_names"]):
@@ -28,8 +28,15 @@
 
 import json
 import sqlite3
+from functools import lru_cache
 from nltk import word_tokenize
 
+# same optional orjson as helpers.load_json; this module also runs standalone (parse_sql_one.py) and cannot import helpers
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 CLAUSE_KEYWORDS = ('select', 'from', 'where', 'group', 'order', 'limit', 'intersect', 'union', 'except')
 JOIN_KEYWORDS = ('join', 'on', 'as')
 
@@ -151,8 +158,10 @@ def get_schema_from_json(fpath):
 def tokenize(string):
     string = str(string)
     string = string.replace("\'", "\"")  # ensures all string values wrapped by "" problem??
-    quote_idxs = [idx for idx, char in enumerate(string) if char == '"']
-    assert len(quote_idxs) % 2 == 0, "Unexpected quote"
+    # fast path: most queries carry no string literal, skip the per-character quote scan
+    n_quotes = string.count('"')
+    assert n_quotes % 2 == 0, "Unexpected quote"
+    quote_idxs = [idx for idx, char in enumerate(string) if char == '"'] if n_quotes else []
 
     # keep string value as token
     vals = {}
@@ -164,20 +173,16 @@ def tokenize(string):
         string = string[:qidx1] + key + string[qidx2+1:]
         vals[key] = val
 
-    toks = [word.lower() for word in word_tokenize(string)]
-    # replace with string value token
-    for i in range(len(toks)):
-        if toks[i] in vals:
-            toks[i] = vals[toks[i]]
-
-    # find if there exists !=, >=, <=
-    eq_idxs = [idx for idx, tok in enumerate(toks) if tok == "="]
-    eq_idxs.reverse()
+    # single pass: lower-case, replace with string value token and merge !=, >=, <=
     prefix = ('!', '>', '<')
-    for eq_idx in eq_idxs:
-        pre_tok = toks[eq_idx-1]
-        if pre_tok in prefix:
-            toks = toks[:eq_idx-1] + [pre_tok + "="] + toks[eq_idx+1: ]
+    toks = []
+    for word in word_tokenize(string):
+        tok = word.lower()
+        tok = vals.get(tok, tok)
+        if tok == "=" and len(toks) > 0 and toks[-1] in prefix:
+            toks[-1] = toks[-1] + "="
+        else:
+            toks.append(tok)
 
     return toks
 
@@ -577,6 +582,9 @@ def parse_sql(toks, start_idx, tables_with_alias, schema):
 
 
 def load_data(fpath):
+    if orjson is not None:
+        with open(fpath, "rb") as f:
+            return orjson.loads(f.read())
     with open(fpath) as f:
         data = json.load(f)
     return data
@@ -596,9 +604,10 @@ def skip_semicolon(toks, start_idx):
         idx += 1
     return idx
 
+@lru_cache(maxsize=4)
 def get_schemas_from_json(fpath):
-    with open(fpath) as f:
-        data = json.load(f)
+    # tables.json is shared by the sql parser and the query recommender, read it once per path
+    data = load_data(fpath)
     db_names = [db['db_id'] for db in data]
 
     tables = {}
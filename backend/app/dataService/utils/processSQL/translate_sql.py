@@ -24,18 +24,21 @@ where_dict = {
 }
 
 
+styled_col_template = '<span class="entity-id">{}</span>\'s \
+            <span class="column-id">{}</span>'
+
+
 def is_none(token):
     return token is None or token == 'none' or token == ''
 
 
 def col_id2text(col_id, with_style=True):
-    table_id = col_id.split(': ')[0]
-    real_col_id = col_id.split(': ')[1]
+    col_parts = col_id.split(': ')
+    table_id, real_col_id = col_parts[0], col_parts[1]
     if real_col_id == '*':
         real_col_id = 'all information'
     if with_style:
-        text = '<span class="entity-id">{}</span>\'s \
-            <span class="column-id">{}</span>'.format(table_id, real_col_id)
+        text = styled_col_template.format(table_id, real_col_id)
     else:
         # text = '{}\'s {}'.format(table_id, real_col_id)
         text = real_col_id
@@ -72,13 +75,13 @@ def cond_unit2text(cond_unit, with_style=True):
 
 
 def where2text(condition, with_style=True):
-    where_sentence = ""
+    parts = []
     for i, cond_unit in enumerate(condition):
         if i % 2 == 1:
-            where_sentence += " {} ".format(cond_unit)
+            parts.append(" {} ".format(cond_unit))
         else:
-            where_sentence += cond_unit2text(cond_unit, with_style)
-    return where_sentence
+            parts.append(cond_unit2text(cond_unit, with_style))
+    return "".join(parts)
 
 
 def select_unit2text(select_unit, with_style=True):
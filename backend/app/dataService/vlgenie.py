@@ -5,6 +5,8 @@ except ImportError:
 
 
 class VLGenie:
+    # one instance is created per candidate design, keep them free of a per-instance __dict__
+    __slots__ = ('vl_spec', 'bin', 'score_obj')
 
     def __init__(self):
 
@@ -24,33 +26,13 @@ class VLGenie:
 
     def set_vis_type(self, vis):
 
+        if vis in constants.vl_mark_types:
+            self.vl_spec['mark']['type'] = constants.vl_mark_types[vis]
+
         if vis == 'histogram':
-            self.vl_spec['mark']['type'] = 'bar'
             self.bin = True
 
-        elif vis == 'barchart':
-            self.vl_spec['mark']['type'] = 'bar'
-
-        elif vis == 'linechart':
-            self.vl_spec['mark']['type'] = 'line'
-
-        elif vis == 'areachart':
-            self.vl_spec['mark']['type'] = 'area'
-
-        elif vis == 'scatterplot':
-            self.vl_spec['mark']['type'] = 'point'
-
-        elif vis == 'boxplot':
-            self.vl_spec['mark']['type'] = 'boxplot'
-
-        elif vis == 'stripplot':
-            self.vl_spec['mark']['type'] = 'tick'
-
-        elif vis == 'piechart':
-            self.vl_spec['mark']['type'] = 'arc'
-
         elif vis == 'donutchart':
-            self.vl_spec['mark']['type'] = 'arc'
             # ToDo:- Smartly set the below value depending on the chart
             # The below value is in Pixels and independent of the generated chart dimensions
             # which can be problematic when there are single v/s multiple donut charts.
@@ -5,7 +5,7 @@ import pandas as pd
 from time import time
 
 from flask import Blueprint, current_app, request, jsonify
-from app.dataService.utils import processSQL
+from app.dataService.utils import processSQL, helpers
 
 LOG = logging.getLogger(__name__)
 
@@ -14,7 +14,7 @@ api = Blueprint('api', __name__)
 
 @api.route('/')
 def index():
-    print('main url!')
+    LOG.debug('main url!')
     return json.dumps('/')
 
 
@@ -31,7 +31,7 @@ def initialization(dataset):
 def get_tables(db_id):
     # TODO: initialize the query context when the db is (re)selected
     current_app.dataService.init_query_context(db_id)
-    print("query cache init.")
+    LOG.debug("query cache init.")
     return jsonify(current_app.dataService.get_tables(db_id))
 
 
@@ -54,15 +54,16 @@ def text2sql():
     db_id = text2sql_data["db_id"]
     sql = current_app.dataService.text2sql(user_text, db_id)
     current_app.dataService.set_query_context(sql, db_id)  # set query context
-    result = {'sql': sql, 'data': current_app.dataService.sql2data(sql, db_id).values.tolist()}
-    print("text2sql: ", result)
+    # the client only needs the raw rows, skip the DataFrame round trip
+    result = {'sql': sql, 'data': current_app.dataService.sql2rows(sql, db_id)}
+    LOG.debug("text2sql: %s", result)
     return jsonify(result)
 
 
 @api.route("/sql2vis/<sql_text>/<db_id>", methods=['GET'])
 def sql2vis(sql_text, db_id="cinema"):
     response = current_app.dataService.sql2vl(sql_text, db_id, return_data=True)
-    data = response['data'].to_dict('records')
+    data = response['records']
     content = response['vl']
     if isinstance(content, list):
         # TODO: vega-vue only supports the following mark types
@@ -70,7 +71,7 @@ def sql2vis(sql_text, db_id="cinema"):
                    ["bar", "circle", "square", "tick", "line", "area", "point", "rule", "text"]]
         returnType = 'vega-lite'
     elif isinstance(content, pd.DataFrame):
-        content = content.to_dict('records')
+        content = data  # the table fallback is the query result itself
         returnType = 'table'
     else:
         returnType = 'data'
@@ -79,8 +80,7 @@ def sql2vis(sql_text, db_id="cinema"):
 
 @api.route("/sql2text/<sql_text>/<db_id>", methods=['GET'])
 def sql2text(sql_text, db_id="cinema"):
-    sql_parsed = current_app.dataService.parsesql(sql_text, db_id)
-    sql_decoded = processSQL.decode_sql(sql_parsed["sql_parse"], sql_parsed["table"])
+    sql_decoded = current_app.dataService.decodesql(sql_text, db_id)
     text = processSQL.sql2text(sql_decoded)
     response = {'sqlDecoded': sql_decoded, 'text': text}
     return jsonify(response)
@@ -103,10 +103,13 @@ def get_user_data():
     username = user_data["username"]
     systype = user_data["systype"]
     timestamp = int(time())
-    print(os.path.join(user_data_folder, f"{userid}-{username}-{systype}-{timestamp}.json"))
-    with open(os.path.join(user_data_folder, f"{userid}-{username}-{systype}-{timestamp}.json"),
-              "w") as f:
-        json.dump(user_data, f)
+    user_data_path = os.path.join(user_data_folder, f"{userid}-{username}-{systype}-{timestamp}.json")
+    LOG.debug("saving user data to %s", user_data_path)
+    try:
+        helpers.dump_json(user_data, user_data_path)
+    except OSError:
+        LOG.exception("failed to save user data to %s", user_data_path)
+        return jsonify("failed to save user data!"), 500
     return jsonify("successfully save user data!")
 
 
@@ -1,10 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 # from app import app
 from app.routes.app import create_app
 from gevent.pywsgi import WSGIServer
 
+# hand log records to a background thread so request handlers never block on log output
+log_queue = queue.Queue(-1)
+root_logger = logging.getLogger()
+# e.g. LOG_LEVEL=DEBUG to see the per-request debug messages
+root_logger.setLevel(os.environ.get("LOG_LEVEL", "WARNING").upper())
+root_logger.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
+
 app = create_app()
 
 http_server = WSGIServer(('0.0.0.0', 5011), app)